@@ -0,0 +1,102 @@
+// Client of delta_canvas.DeltaCanvasGrid: keeps the agents shown and applies the changes sent each step.
+// Drawn bottom up: pheromone heatmap, static agents (drawn once to their own canvas), the other agents.
+var DeltaCanvasModule = function(canvas_width, canvas_height, grid_width, grid_height, heatmap_color) {
+	var canvas = $(`<canvas width="${canvas_width}" height="${canvas_height}" class="world-grid"/>`)[0];
+	var parent = $(`<div style="height:${canvas_height}px;" class="world-grid-parent"></div>`)[0];
+	$("#elements").append(parent);
+	parent.append(canvas);
+	var context = canvas.getContext("2d");
+
+	var staticCanvas = document.createElement("canvas");
+	staticCanvas.width = canvas_width;
+	staticCanvas.height = canvas_height;
+	var heatmapCanvas = document.createElement("canvas");
+	var hasHeatmap = false;
+	var heatmapBlock = 1;  // cells of the grid per cell of the heatmap, in both directions
+
+	var cellWidth = canvas_width / grid_width;
+	var cellHeight = canvas_height / grid_height;
+	var styles = {};
+	var agents = new Map();  // id -> [x, y, style, text]
+
+	// same shapes as GridDraw.js: circles of radius r and rectangles of size w x h, in cells; y goes up
+	var drawShape = function(ctx, x, y, style, text) {
+		var cx = (x + 0.5) * cellWidth;
+		var cy = (grid_height - y - 0.5) * cellHeight;
+		ctx.beginPath();
+		if (style.Shape == "circle") {
+			var r = style.r * Math.min(cellWidth, cellHeight) / 2;
+			ctx.arc(cx, cy, r, 0, Math.PI * 2, false);
+		} else {
+			var w = style.w * cellWidth, h = style.h * cellHeight;
+			ctx.rect(cx - w / 2, cy - h / 2, w, h);
+		}
+		if (String(style.Filled).toLowerCase() == "true") {
+			ctx.fillStyle = style.Color;
+			ctx.fill();
+		} else {
+			ctx.strokeStyle = style.Color;
+			ctx.stroke();
+		}
+		if (text !== null && text !== undefined) {
+			ctx.fillStyle = style.text_color || "black";
+			ctx.textAlign = "center";
+			ctx.textBaseline = "middle";
+			ctx.fillText(text, cx, cy);
+		}
+	};
+
+	var drawHeatmap = function(heatmap) {
+		hasHeatmap = heatmap !== null;
+		if (!hasHeatmap)
+			return;
+		heatmapBlock = heatmap.block;
+		var values = atob(heatmap.data);
+		heatmapCanvas.width = heatmap.width;
+		heatmapCanvas.height = heatmap.height;
+		var ctx = heatmapCanvas.getContext("2d");
+		var image = ctx.createImageData(heatmap.width, heatmap.height);
+		var rgb = heatmap_color.split(",").map(Number);
+		for (var x = 0; x < heatmap.width; x++) {
+			for (var y = 0; y < heatmap.height; y++) {
+				var i = 4 * ((heatmap.height - y - 1) * heatmap.width + x);
+				image.data[i] = rgb[0];
+				image.data[i + 1] = rgb[1];
+				image.data[i + 2] = rgb[2];
+				image.data[i + 3] = values.charCodeAt(x * heatmap.height + y) / 2;
+			}
+		}
+		ctx.putImageData(image, 0, 0);
+	};
+
+	this.render = function(data) {
+		Object.assign(styles, data.styles);
+		if (data.full) {
+			agents.clear();
+			var staticContext = staticCanvas.getContext("2d");
+			staticContext.clearRect(0, 0, canvas_width, canvas_height);
+			data.static.forEach(([x, y, style]) => drawShape(staticContext, x, y, styles[style], null));
+		}
+		data.removed.forEach(id => agents.delete(id));
+		data.added.forEach(([id, x, y, style, text]) => agents.set(id, [x, y, style, text]));
+		data.moved.forEach(([id, x, y]) => { var agent = agents.get(id); agent[0] = x; agent[1] = y; });
+		data.labels.forEach(([id, text]) => { agents.get(id)[3] = text; });
+		if ("heatmap" in data)
+			drawHeatmap(data.heatmap);
+
+		context.clearRect(0, 0, canvas_width, canvas_height);
+		if (hasHeatmap) {
+			context.imageSmoothingEnabled = false;
+			var w = heatmapCanvas.width * heatmapBlock * cellWidth, h = heatmapCanvas.height * heatmapBlock * cellHeight;
+			context.drawImage(heatmapCanvas, 0, canvas_height - h, w, h);
+		}
+		context.drawImage(staticCanvas, 0, 0);
+		agents.forEach(([x, y, style, text]) => drawShape(context, x, y, styles[style], text));
+	};
+
+	this.reset = function() {
+		agents.clear();
+		hasHeatmap = false;
+		context.clearRect(0, 0, canvas_width, canvas_height);
+	};
+};
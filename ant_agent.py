@@ -1,16 +1,19 @@
 from mesa import Agent
+from ants_space import ANT_KIND, FOOD_KIND
 import ants_model
 import numpy as np
-import random
 
 
 ANT_SIZE_CARGO_RATIO = 5  # food_cargo = X * ant_size
 SIZE_HEALTH_RATIO = 2  # ant_health = X * ant_size
 SIZE_DAMAGE_RATIO = 1  # inflicted_damage = X * ant_size
-SELF_PHEROMONE_STRENGTH = 60  # strength of the self pheromone
+HOME_PHEROMONE_STRENGTH = 100  # strength of the home trail pheromone left by an ant leaving the anthill
+HOME_TRAIL_GRADIENT = 2  # the home trail is left weaker by X for every turn the ant is out of the anthill
 MAX_PHEROMONE_STRENGTH = 100  # maximum strength of a pheromone on a pheromone map
 ENERGY_TO_RETURN = 50  # when energy of foraging ant falls below ENERGY_TO_RETURN it tries to come back
 FOOD_TO_START_COLONY = 100  # minimal number of food units in the food site for queen to start a colony
+HUNGRY_ENERGY = 80  # ants inside the anthill eat when their energy falls below HUNGRY_ENERGY
+MEAL_PERIOD = 100 - HUNGRY_ENERGY + 1  # turns between meals of a well fed ant resting inside the anthill
 
 
 class Ant(Agent):
@@ -28,9 +31,24 @@ class Ant(Agent):
         self.forage = False
         self.lost = False
         self.food_trail_pheromone_strength = 0
+        self.inside = False
+        self.rest_since = 0  # first turn of resting inside the anthill not yet accounted in energy
+        self.left_at = 0  # turn the ant last left the anthill
 
+    # orientation is always one of the 8 unit steps, also when the ant walked over the edge of a toroidal map
     def update_orientation(self):
-        self.orient = (self.pos[0] - self.last_pos[0], self.pos[1] - self.last_pos[1])
+        dx, dy = self.pos[0] - self.last_pos[0], self.pos[1] - self.last_pos[1]
+        if self.model.grid.torus:
+            dx = (dx + 1) % self.model.grid.width - 1
+            dy = (dy + 1) % self.model.grid.height - 1
+        self.orient = (dx, dy)
+
+    # cell reached by going `steps` cells in the direction of the ant
+    def ahead(self, steps=1):
+        cell = self.pos[0] + steps * self.orient[0], self.pos[1] + steps * self.orient[1]
+        if self.model.grid.torus:
+            cell = self.model.grid.torus_adj(cell)
+        return cell
 
     # Move to the given cell. Leave food trail pheromone if carry food
     def move(self, new_position):
@@ -41,34 +59,33 @@ class Ant(Agent):
         if self.cargo and not self.lost:
             self.leave_pheromone("food trail", self.food_trail_pheromone_strength)
 
-    # get dictionary of objects in the 8-neighbourhood (only enemies and food)
+    # kind of the cell the ant stands on, see AntsGrid.kinds
+    @property
+    def cell_kind(self):
+        return ANT_KIND + self.species.id
+
+    # get dictionary of objects in the 8-neighbourhood (only enemies and food).
+    # Cells are told apart by their kind, agents are fetched only for the enemies and food found
     def sense_neighborhood(self):
         objects = {"enemies": [], "food": []}
-        for neighbor in self.model.grid.iter_neighbors(self.pos, moore=True, include_center=False):
-            if isinstance(neighbor, ants_model.FoodSite):
-                objects["food"].append(neighbor)
-            elif isinstance(neighbor, Ant) and id(neighbor.species) != id(self.species):
-                objects["enemies"].append(neighbor)
+        grid = self.model.grid
+        kinds, height = grid.kinds, grid.height
+        own_kind = ANT_KIND + self.species.id
+        for cell in self.model.neighborhoods.flat_neighborhood(self.pos):
+            kind = kinds[cell]
+            if kind == FOOD_KIND:
+                objects["food"].append(grid.grid[cell // height][cell % height])
+            elif kind >= ANT_KIND and kind != own_kind:
+                objects["enemies"].append(grid.grid[cell // height][cell % height])
         return objects
 
     # attack given ant
     def attack(self, agent):
         agent.health -= self.size * SIZE_DAMAGE_RATIO
 
-    # Finds more or less straight path based on intersection of current neighborhood and other neighborhood
+    # Finds more or less straight path: 3 cells in front ("narrow") or 3 cells in front + 2 cells at sides ("wide")
     def find_straight_path_points(self, field):
-        first_neighborhood = set(self.model.grid.get_neighborhood(self.pos, moore=True, include_center=False))
-
-        if field == "wide":  # 3 cells in front + 2 cells at sides
-            second_neighborhood = set(self.model.grid.get_neighborhood(self.last_pos, moore=False, include_center=True))
-            possible_moves = list(first_neighborhood - second_neighborhood)
-
-        elif field == "narrow":  # 3 cells in front
-            next_point = self.pos[0] + self.orient[0], self.pos[1] + self.orient[1]
-            second_neighborhood = set(self.model.grid.get_neighborhood(next_point, moore=False, include_center=True))
-            possible_moves = list(first_neighborhood & second_neighborhood)
-
-        return possible_moves
+        return self.model.neighborhoods.field(self.pos, self.orient, field)
 
     # go in search for food
     def go_forage(self):
@@ -79,52 +96,49 @@ class Ant(Agent):
             self.turn_around()
             return
 
-        moves = self.find_straight_path_points("narrow")
-        empty_cells = set(moves) & self.model.grid.empties
+        empty_cells = self.empty_cells(self.find_straight_path_points("narrow"))
         if not empty_cells:
-            moves = self.find_straight_path_points("wide")
-            empty_cells = set(moves) & self.model.grid.empties
+            empty_cells = self.empty_cells(self.find_straight_path_points("wide"))
             if not empty_cells:
                 self.turn_around()
                 return
         weights = self.weigh_straight_path_points(empty_cells)
-        new_pos = random.choices(list(empty_cells), weights, k=1)[0]
+        new_pos = self.choose(empty_cells, weights)
         self.move(new_pos)
 
     def go_random(self):
-        moves = self.find_straight_path_points("narrow")
-        moves = list(set(moves) & self.model.grid.empties)
+        moves = self.empty_cells(self.find_straight_path_points("narrow"))
         if moves:
             weights = self.weigh_straight_path_points(moves, w=4)
-            self.move(random.choices(moves, weights)[0])
+            self.move(self.choose(moves, weights))
         else:
             self.turn_around()
 
-    def go_down_the_trail(self, pheromone):
+    # Follow the trail: to the farthest trail cell in front, or with uphill to the strongest one
+    def go_down_the_trail(self, pheromone, uphill=False):
         moves = self.find_straight_path_points("wide")
-        empty_cells = set(moves) & self.model.grid.empties
+        empty_cells = self.empty_cells(moves)
         if not empty_cells:
             self.turn_around()
             return
 
-        trail = self.smell_cells_for(pheromone, moves)
+        trail = self.smell_path(pheromone, "wide", moves)
         destiny_cell = "occupied" if trail else None
 
-        empty_trail_cells = list(set(trail) & empty_cells)
+        empty_trail_cells = [cell for cell in empty_cells if cell in trail]
         if empty_trail_cells:
-            farthest_move = sorted(empty_trail_cells,
-                                   key=lambda x: abs(x[0] - self.pos[0]) + abs(x[1] - self.pos[1]),
-                                   reverse=True)[0]
-            destiny_cell = farthest_move
+            x, y = self.pos
+            if uphill:
+                destiny_cell = max(empty_trail_cells,
+                                   key=lambda cell: (trail[cell], abs(cell[0] - x) + abs(cell[1] - y)))
+            else:
+                destiny_cell = max(empty_trail_cells, key=lambda cell: abs(cell[0] - x) + abs(cell[1] - y))
 
         # move to a cell adjacent to the pheromone cell
-        else:
-            possible_trail_moves = []
-            for trail_cell in list(trail):
-                possible_trail_moves += self.model.grid.get_neighborhood(trail_cell, moore=False)  # 4 cells (cross)
-            possible_trail_moves = set(possible_trail_moves) & empty_cells
+        elif trail:
+            possible_trail_moves = self.cells_next_to_trail(moves, empty_cells, trail)
             if possible_trail_moves:
-                destiny_cell = random.choice(list(possible_trail_moves))
+                destiny_cell = self.choose(possible_trail_moves)
 
         if destiny_cell == "occupied":
             pass
@@ -134,23 +148,49 @@ class Ant(Agent):
             self.turn_around()
             self.lost = True
 
+    # empty cells of the wide field next to (in the 4-neighbourhood of) a trail cell.
+    # The trail lies within the field, so the precomputed adjacency of the field cells is enough
+    def cells_next_to_trail(self, moves, empty_cells, trail):
+        adjacency = self.model.neighborhoods.field_adjacency(self.pos, self.orient)
+        if adjacency is None or len(moves) != len(adjacency):
+            next_to_trail = set()
+            for trail_cell in trail:
+                next_to_trail.update(self.model.neighborhoods.neighborhood(trail_cell, moore=False))  # 4 cells (cross)
+            return [cell for cell in empty_cells if cell in next_to_trail]
+        on_trail = [cell in trail for cell in moves]
+        occupied = self.model.grid.occupied
+        return [cell for cell, neighbors in zip(moves, adjacency)
+                if not occupied[cell] and any(on_trail[j] for j in neighbors)]
+
     # used to get probabilities of next cell when going random. w is the weight of the cell in straight line
     def weigh_straight_path_points(self, moves, w=6):
-        next_point = self.pos[0] + self.orient[0], self.pos[1] + self.orient[1]
+        next_point = self.ahead()
         move_weights = [w if pos == next_point else 1 for pos in moves]
         return move_weights
 
     def leave_pheromone(self, smell, strength):
-        x, y = self.pos
-        self.model.pheromone_map[smell][x][y] = min(self.model.pheromone_map[smell][x][y] + strength,
-                                                    MAX_PHEROMONE_STRENGTH)
+        self.model.pheromone_map.deposit(smell, self.pos, strength, MAX_PHEROMONE_STRENGTH)
+
+    # The home trail is shared by the whole colony. Every ant leaves it weaker the longer it is out, faster than
+    # the trail evaporates, so along any ant's way the trail gets stronger towards the anthill
+    def leave_home_trail(self):
+        strength = HOME_PHEROMONE_STRENGTH - HOME_TRAIL_GRADIENT * (self.model.schedule.steps - self.left_at)
+        if strength > 0:
+            self.model.pheromone_map.mark(self.anthill, self.pos, strength)
 
     def smell_cells_for(self, smell, cells):
-        smells = {}
-        for x, y in cells:
-            if self.model.pheromone_map[smell][x][y] > 0:
-                smells[(x, y)] = self.model.pheromone_map[smell][x][y]
-        return smells
+        return self.model.pheromone_map.smell(smell, cells)
+
+    # smell the cells of the straight path field; cells are the field if it was already looked up
+    def smell_path(self, smell, field, cells=None):
+        return self.smell_cells_for(smell, cells if cells is not None else self.find_straight_path_points(field))
+
+    def empty_cells(self, cells):
+        return self.model.grid.empty_cells(cells)
+
+    # random cell from the list, with the given weights
+    def choose(self, cells, weights=None):
+        return self.random.choices(cells, weights)[0]
 
     def turn_around(self):
         self.last_pos = self.pos[0] + self.orient[0], self.pos[1] + self.orient[1]
@@ -160,17 +200,27 @@ class Ant(Agent):
     def take_food(self, food_site):
         self.cargo = min(self.size * ANT_SIZE_CARGO_RATIO, food_site.food_units)
         food_site.food_units -= self.cargo
+        if self.model.events is not None:
+            self.model.log_event("food pickup", self, food_site.pos, self.cargo)
+        if not food_site.food_units and not food_site.rate:  # sites that don't regenerate are gone when empty
+            food_site.destroy()
+        self.species.census[ants_model.FOOD_IN_TRANSIT] += self.cargo
         self.food_trail_pheromone_strength = food_site.food_units / 3
         self.leave_pheromone("food trail", self.food_trail_pheromone_strength)
         self.turn_around()
 
     def enter_anthill(self):
+        if self.model.events is not None and self.cargo:
+            self.model.log_event("food delivery", self, self.anthill.pos, self.cargo)
         self.anthill.food_units += self.cargo
+        self.species.census[ants_model.FOOD_IN_TRANSIT] -= self.cargo
         self.cargo = 0
         self.lost = False
         self.forage = False
+        self.model.schedule.remove(self)
         self.model.grid.remove_agent(self)
-        self.anthill.ants_inside.append(self)
+        self.model.ants_outside -= 1
+        self.anthill.admit(self)
         self.eat()
 
     # so far an ant can eat only inside the anthill
@@ -180,29 +230,57 @@ class Ant(Agent):
         self.energy += to_eat * self.species.energy_food
         self.anthill.food_units -= to_eat
 
+    # Account the turns spent resting inside the anthill up to (excluding) the given turn.
+    # The anthill pays for the meals of resting ants every turn, so the ant eats to full whenever hungry.
+    def settle(self, until):
+        turns = until - self.rest_since
+        if turns <= 0:
+            return
+        self.rest_since = until
+        first_meal = max(1, self.energy - HUNGRY_ENERGY + 1)
+        if turns < first_meal:
+            self.energy -= turns
+        else:
+            self.energy = 100 - (turns - first_meal) % MEAL_PERIOD
+
+    # one turn inside the anthill which can't feed all its ants; they eat what is left
+    def rest(self, turn):
+        self.settle(turn)
+        self.rest_since = turn + 1
+        self.energy -= 1
+        if self.energy <= 0:
+            self.die()
+        elif self.energy < HUNGRY_ENERGY:
+            self.eat()
+
     def die(self):
-        self.model.schedule.remove(self)
-        if type(self) == Ant:  # we don't count queens
-            self.anthill.worker_counter -= 1
-        if self in self.anthill.ants_inside:
-            self.anthill.ants_inside.remove(self)
+        if self.model.events is not None:
+            self.model.log_event("queen died" if isinstance(self, Queen) else "worker died", self,
+                                 self.anthill.pos if self.inside else self.pos, self.energy)
+        if self.inside:
+            self.anthill.evict(self)
         else:
+            self.model.schedule.remove(self)
             self.model.grid.remove_agent(self)
-        if self in self.model.pheromone_map:
-            del self.model.pheromone_map[self]
+            self.model.ants_outside -= 1
+        if not isinstance(self, Queen):  # we don't count queens
+            self.anthill.worker_counter -= 1
+        else:
+            self.species.census[ants_model.QUEENS] -= 1
+        self.species.census[ants_model.FOOD_IN_TRANSIT] -= self.cargo
+        self.cargo = 0
 
-    #  whole ant steering is performed here
+    # Ants resting inside the anthill are not scheduled
     def step(self):
         self.energy -= 1
         if self.health <= 0 or self.energy <= 0:
             self.die()
             return
-        elif self in self.anthill.ants_inside or self in self.anthill.queens_inside:
-            if self.energy < 80:
-                self.eat()
-            return
+        self.act()
 
-        self.leave_pheromone(self, SELF_PHEROMONE_STRENGTH)
+    #  whole ant steering is performed here
+    def act(self):
+        self.leave_home_trail()
 
         objects = self.sense_neighborhood()
         if objects["enemies"]:
@@ -213,20 +291,20 @@ class Ant(Agent):
             if self.pos in self.anthill.surrounding_cells:
                 self.enter_anthill()
             else:
-                self.go_down_the_trail(self)
+                self.go_down_the_trail(self.anthill, uphill=True)
         elif self.forage:
             self.go_forage()
         elif self.lost:
             if self.pos in self.anthill.surrounding_cells:
                 self.enter_anthill()
             else:
-                food_trail = self.smell_cells_for("food trail", self.find_straight_path_points("wide"))
-                self_trail = self.smell_cells_for("food trail", self.find_straight_path_points("wide"))
+                food_trail = self.smell_path("food trail", "wide")
+                home_trail = self.smell_path(self.anthill, "wide")
 
                 if food_trail:
                     self.go_down_the_trail("food trail")
-                elif self_trail:
-                    self.go_down_the_trail(self)
+                elif home_trail:
+                    self.go_down_the_trail(self.anthill, uphill=True)
                 else:
                     self.go_random()
         else:
@@ -238,34 +316,33 @@ class Queen(Ant):
         super().__init__(unique_id, model, species, pos, anthill)
         self.health *= 2
 
-    # start a new colony on a rich food site
-    def start_new_colony(self):
-        objects = self.sense_neighborhood()
-        food_sites = list(objects["food"])
+    # queens don't eat inside the anthill
+    def settle(self, until):
+        turns = until - self.rest_since
+        if turns > 0:
+            self.rest_since = until
+            self.energy -= turns
+
+    # start a new colony on a rich food site next to the queen
+    def start_new_colony(self, food_sites):
         for f_s in food_sites:
             if f_s.food_units >= FOOD_TO_START_COLONY:
                 anthill = ants_model.Anthill(self.model.next_id(), self.model, self.species, f_s.pos, f_s.food_units)
-                self.model.grid.remove_agent(f_s)
-                self.model.schedule.remove(f_s)
+                if self.model.events is not None:
+                    self.model.log_event("colony founded", anthill, anthill.pos, anthill.food_units)
+                f_s.destroy()
                 self.model.schedule.add(anthill)
                 self.model.grid.place_agent(anthill, anthill.pos)
                 return True
         return False
 
-    def step(self):
-        self.energy -= 1
-        if self.health <= 0 or self.energy <= 0:
-            self.die()
-            return
-        elif self in self.anthill.queens_inside:
-            return
-
+    def act(self):
         objects = self.sense_neighborhood()
         if objects["enemies"]:
             self.attack(objects["enemies"][0])
             return
         elif objects["food"]:
-            succeeded = self.start_new_colony()
+            succeeded = self.start_new_colony(objects["food"])
             if succeeded:
                 self.die()
                 return
@@ -1,14 +1,20 @@
 import ant_agent
-from mesa import Model
-from mesa.space import *
+from ants_space import AntsGrid, NeighborhoodIndex, FOOD_KIND
+from pheromones import PheromoneMap, MappedPheromoneMap
+from mesa import Agent, Model
 from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
-from collections import defaultdict
+from collections import deque
+from functools import partial
+from instrumentation import Profiler
+import math
+import pickle
 import random
+import zlib
 import numpy as np
 
 FOOD_SIZE_BIRTH_RATIO = 2  # food required to produce a new ant = FOOD_SIZE_BIRTH_RATIO * ant_size
 FOOD_PER_FOOD_SITE = 300
+FOOD_SCENT = 2  # strength of the "food" pheromone around a food site, added up for neighbouring sites
 SEND_FORAGING_PARTY_TURN = 30  # every SEND_FORAGING_PARTY_TURN turn some ants go looking for the food
 FORAGING_SENDING_DURATION = 4  # duration of period when sending foraging ants
 QUEEN_SEASON_DURATION = 5  # duration of season in which queens are born
@@ -17,6 +23,10 @@ QUEEN_SEASON_SPEC_DIFF = 20
 FOOD_BIRTH_PROB = 0.02  # probability of an ant being born = FOOD_BIRTH_PROB * (
 # (self.food_units - minimum_food) // self.birth_food) * self.species.reproduction_rate, line 136
 ANTS_RELEASE_TURN = 2  # ants may be released every ANTS_RELEASE_TURN
+SNAPSHOT_COMPRESSION = 1  # zlib level of snapshots; pheromone layers are mostly zeros
+# per species aggregates kept up to date where they change, one row of AntsWorld.census per species
+CENSUS_FIELDS = ("workers", "queens", "anthills", "food stored", "food in transit")
+WORKERS, QUEENS, ANTHILLS, FOOD_STORED, FOOD_IN_TRANSIT = range(len(CENSUS_FIELDS))
 
 
 # TODO colony decides whether to release ants based on food supplies
@@ -28,16 +38,20 @@ def sign(x):
     return x // abs(x)
 
 
+# first turn after the given one inside the periodic window: turn % period < duration, after the first period
+def next_turn(turn, period, duration):
+    turn = max(turn + 1, period + 1)
+    if turn % period < duration:
+        return turn
+    return turn - turn % period + period
+
+
 def count_ants(model, species_id):
-    species = list(filter(lambda x: x.id == species_id, model.species_list))[0]
-    ants = [ah.worker_counter for ah in species.anthills]
-    return sum(ants)
+    return int(model.species_by_id[species_id].census[WORKERS])
 
 
 def count_food(model, species_id):
-    species = list(filter(lambda x: x.id == species_id, model.species_list))[0]
-    food = [ah.food_units for ah in species.anthills]
-    return sum(food)
+    return float(model.species_by_id[species_id].census[FOOD_STORED])
 
 
 class Species:
@@ -47,6 +61,7 @@ class Species:
         self.ant_size = ant_size
         self.energy_food = 100 / self.ant_size  # how much energy is restored by one food unit
         self.anthills = []
+        self.census = np.zeros(len(CENSUS_FIELDS))  # replaced by a row of AntsWorld.census
 
 
 class Obstacle(Agent):
@@ -55,102 +70,266 @@ class Obstacle(Agent):
         self.pos = pos
 
 
+# Food sites are not scheduled: their scent is added to the "food" layer when they are placed and taken
+# away when they are removed, and food regenerates (rate per turn) only when somebody looks at it
 class FoodSite(Agent):
+    cell_kind = FOOD_KIND
+
     def __init__(self, unique_id, model, initial_food_units, pos, r_rate=0):
         super().__init__(unique_id, model)
         self.initial_food_units = initial_food_units
-        self.food_units = initial_food_units
+        self._food_units = initial_food_units
         self.rate = r_rate  # regeneration rate of food
+        self.regenerated_at = model.schedule.steps
         self.pos = pos
 
+    @property
+    def food_units(self):
+        if self.rate:
+            steps = self.model.schedule.steps
+            self._food_units = min(self._food_units + self.rate * (steps - self.regenerated_at),
+                                   self.initial_food_units)
+            self.regenerated_at = steps
+        return self._food_units
+
+    @food_units.setter
+    def food_units(self, value):
+        self.food_units  # account the regeneration so far
+        self._food_units = value
+
+    def place(self):
+        if not self.food_units and not self.rate:  # an empty site is gone right away
+            return
+        self.model.grid.place_agent(self, self.pos)
+        self.model.pheromone_map.add("food", self.model.neighborhoods.neighborhood(self.pos), FOOD_SCENT)
+
     def destroy(self):
-        self.model.schedule.remove(self)
+        self.model.pheromone_map.add("food", self.model.neighborhoods.neighborhood(self.pos), -FOOD_SCENT)
         self.model.grid.remove_agent(self)
 
-    def step(self):
-        self.food_units = min(self.food_units + self.rate, self.initial_food_units)
-        self.food_units += self.rate
-        for x, y in self.model.grid.iter_neighborhood(self.pos, moore=True):
-            self.model.pheromone_map["food"][x][y] = 2
-        if not self.food_units:
-            self.destroy()
-
 
 class Anthill(Agent):
     def __init__(self, unique_id, model, species, pos, food_units=100):
         super().__init__(unique_id, model)
         self.species = species
+        self._food_units = 0
+        self._worker_counter = 0
         self.food_units = food_units
         self.pos = pos
         self.worker_counter = 0
-        self.ants_inside = []
+        # ants resting inside; ants that died there stay in the queues until popped
+        self.ants_inside = deque()
         self.queens_inside = []
-        self.surrounding_cells = self.model.grid.get_neighborhood(self.pos, moore=True)
+        self.n_ants_inside = 0
+        self.n_queens_inside = 0
+        self.surrounding_cells = self.model.neighborhoods.neighborhood(self.pos)
         self.birth_food = self.species.ant_size * FOOD_SIZE_BIRTH_RATIO
         self.turn = 0
+        self.next_birth = None  # turns until the next birth, drawn in advance by next_event
+        self.drawn_birth = None  # (turn, born) decided by the fast forward of the world
 
         species.anthills.append(self)
+        species.census[ANTHILLS] += 1
+        self.model.pheromone_map.add_layer(self)  # home trail of the colony
+
+    # food and workers of the anthill are added to the species census as they change
+    @property
+    def food_units(self):
+        return self._food_units
+
+    @food_units.setter
+    def food_units(self, value):
+        self.species.census[FOOD_STORED] += value - self._food_units
+        self._food_units = value
+
+    @property
+    def worker_counter(self):
+        return self._worker_counter
+
+    @worker_counter.setter
+    def worker_counter(self, value):
+        self.species.census[WORKERS] += value - self._worker_counter
+        self._worker_counter = value
+
+    def admit(self, ant):
+        ant.inside = True
+        ant.rest_since = self.model.schedule.steps + 1
+        if isinstance(ant, ant_agent.Queen):
+            self.queens_inside.append(ant)
+            self.n_queens_inside += 1
+        else:
+            self.ants_inside.append(ant)
+            self.n_ants_inside += 1
 
-    def release_ant(self, pheromone_cells={}, forage=False):
-        if self.queens_inside:
-            ant = self.queens_inside.pop()
+    def evict(self, ant):
+        ant.inside = False
+        if isinstance(ant, ant_agent.Queen):
+            self.n_queens_inside -= 1
         else:
-            ant = self.ants_inside.pop(0)
+            self.n_ants_inside -= 1
+
+    # next ant alive to leave the anthill: the youngest queen or the worker resting for the longest time
+    def pop_resident(self):
+        turn = self.model.schedule.steps
+        while self.n_queens_inside or self.n_ants_inside:
+            ant = self.queens_inside.pop() if self.n_queens_inside else self.ants_inside.popleft()
+            if not ant.inside:
+                continue
+            ant.settle(turn + 1)
+            if ant.energy <= 0:
+                ant.die()
+                continue
+            self.evict(ant)
+            return ant
+        return None
+
+    # queens don't eat inside the anthill; those whose energy runs out in this turn die
+    def starve_queens(self):
+        turn = self.model.schedule.steps
+        for queen in self.queens_inside:
+            if queen.inside and queen.energy <= turn + 1 - queen.rest_since:
+                queen.settle(turn + 1)
+                queen.die()
+        self.queens_inside = [queen for queen in self.queens_inside if queen.inside]
+
+    # Pay for the meals of the resting ants. If there is not enough food every ant eats on its own.
+    # Resting queens die when their energy runs out, so they leave the census in time
+    def feed_residents(self):
+        if self.n_queens_inside:
+            self.starve_queens()
+        upkeep = self.n_ants_inside / self.species.energy_food
+        if self.food_units >= upkeep:
+            self.food_units -= upkeep
+            return
+        turn = self.model.schedule.steps
+        for ant in list(self.ants_inside):
+            if ant.inside and ant.rest_since <= turn:
+                ant.rest(turn)
+        self.ants_inside = deque(ant for ant in self.ants_inside if ant.inside)
+
+    def release_ant(self, pheromone_cells={}, forage=False):
+        ant = self.pop_resident()
+        if ant is None:
+            return
+        if not isinstance(ant, ant_agent.Queen):
             ant.forage = forage
 
-        possible_locations = list(set(self.surrounding_cells) & self.model.grid.empties)
+        possible_locations = self.model.grid.empty_cells(self.surrounding_cells)
         weights = [1] * len(possible_locations)
-        if set(pheromone_cells) & self.model.grid.empties and not forage:
-            possible_locations = list(set(pheromone_cells) & self.model.grid.empties)
+        empty_pheromone_cells = self.model.grid.empty_cells(pheromone_cells)
+        if empty_pheromone_cells and not forage:
+            possible_locations = empty_pheromone_cells
             weights = [pheromone_cells[pl] for pl in possible_locations]
 
-        ant.pos = random.choices(possible_locations, weights)[0]
-        ant.orient = (ant.pos[0] - self.pos[0], ant.pos[1] - self.pos[1])
+        ant.pos = self.random.choices(possible_locations, weights)[0]
+        ant.last_pos = self.pos
+        ant.left_at = self.model.schedule.steps
+        ant.update_orientation()
         self.model.grid.place_agent(ant, ant.pos)
+        self.model.schedule.add(ant)
+        self.model.ants_outside += 1
 
     def make_ant(self, w_or_q):
         if w_or_q == "worker":
             self.food_units -= self.birth_food
             ant = ant_agent.Ant(self.model.next_id(), self.model, self.species, self.pos, self)
             self.worker_counter += 1
-            self.ants_inside.append(ant)
         if w_or_q == "queen":
             self.food_units -= self.birth_food * 2
             ant = ant_agent.Queen(self.model.next_id(), self.model, self.species, self.pos, self)
-            self.queens_inside.append(ant)
-        self.model.schedule.add(ant)
+            self.species.census[QUEENS] += 1
+        self.admit(ant)
+        if self.model.events is not None:
+            self.model.log_event("{} born".format(w_or_q), ant, self.pos)
 
     def destroy(self):
+        if self.model.events is not None:
+            self.model.log_event("anthill destroyed", self, self.pos, self.food_units)
+        for queen in self.queens_inside:  # there are no workers left, queens inside die with the colony
+            if queen.inside:
+                queen.die()
         self.species.anthills.remove(self)
+        self.species.census[ANTHILLS] -= 1
+        self.species.census[FOOD_STORED] -= self.food_units
+        self.model.pheromone_map.drop_layer(self)
         self.model.schedule.remove(self)
         self.model.grid.remove_agent(self)
 
+    def minimum_food(self):
+        return self.birth_food * 2 + self.worker_counter * self.species.ant_size
+
+    def birth_prob(self, food_units, minimum_food):
+        return FOOD_BIRTH_PROB * ((food_units - minimum_food) // self.birth_food) * self.species.reproduction_rate
+
+    def queen_season(self):
+        return QUEEN_SEASON_TURN + QUEEN_SEASON_SPEC_DIFF * (5 - self.species.reproduction_rate)
+
+    # Number of the next turn (1 for the coming one) in which the anthill may do more than feed its residents,
+    # while there are no ants outside. Events are the seasons, a birth, food falling to the next birth
+    # probability or below the upkeep, a queen starving inside, and releasing ants to a food trail next to
+    # the anthill. The birth is drawn in advance: turns until it are geometric with the birth probability.
+    def next_event(self, limit):
+        self.next_birth = None
+        food = self.food_units
+        minimum_food = self.minimum_food()
+        if food <= minimum_food and self.worker_counter == 0:
+            return 1
+        if self.model.pheromone_map.smell("food trail", self.surrounding_cells):
+            return 1
+        turns = min(limit, next_turn(self.turn, self.queen_season(), QUEEN_SEASON_DURATION) - self.turn,
+                    next_turn(self.turn, SEND_FORAGING_PARTY_TURN, FORAGING_SENDING_DURATION) - self.turn)
+        steps = self.model.schedule.steps
+        for queen in self.queens_inside:  # a queen starving inside
+            if queen.inside:
+                turns = min(turns, max(1, queen.energy + queen.rest_since - steps))
+
+        upkeep = self.n_ants_inside / self.species.energy_food
+        surplus = food - minimum_food
+        if upkeep:  # births are as likely as before while the surplus stays above the same multiple of birth_food
+            margin = surplus % self.birth_food if surplus > 0 else food
+            if margin < upkeep:
+                return 1
+            turns = min(turns, int(margin // upkeep))
+
+        birth_prob = self.birth_prob(food - upkeep, minimum_food) if surplus > 0 else 0
+        if birth_prob >= 1:
+            return 1
+        if birth_prob > 0:
+            self.next_birth = 1 + int(math.log(1 - self.random.random()) / math.log(1 - birth_prob))
+            turns = min(turns, self.next_birth)
+        return turns
+
+    # the turns of fast forward in which the anthill only fed its residents
+    def skip(self, turns):
+        self.turn += turns
+        self.food_units -= turns * self.n_ants_inside / self.species.energy_food
+
     def step(self):
         self.turn += 1
-        minimum_food = self.birth_food * 2 + self.worker_counter * self.species.ant_size
+        drawn_birth, self.drawn_birth = self.drawn_birth, None
+        self.feed_residents()
+        minimum_food = self.minimum_food()
 
         if self.food_units <= minimum_food and self.worker_counter == 0:
             self.destroy()
             return
 
         if self.food_units > minimum_food:
-            queen_season = QUEEN_SEASON_TURN + QUEEN_SEASON_SPEC_DIFF * (5 - self.species.reproduction_rate)
+            queen_season = self.queen_season()
             if self.turn % queen_season < QUEEN_SEASON_DURATION and self.turn > queen_season:
                 self.make_ant("queen")
 
-            birth_prob = FOOD_BIRTH_PROB * (
-                    (self.food_units - minimum_food) // self.birth_food) * self.species.reproduction_rate
-            if random.random() < birth_prob:
-                self.make_ant("worker")
-
-        free_surrounding_cells = set(self.surrounding_cells) & self.model.grid.empties
-        if (self.ants_inside or self.queens_inside) and free_surrounding_cells:
-            if self.ants_inside:
-                ant = self.ants_inside[0]
+            birth_prob = self.birth_prob(self.food_units, minimum_food)
+            if drawn_birth is not None and drawn_birth[0] == self.turn:
+                born = drawn_birth[1]
             else:
-                ant = self.queens_inside[0]
+                born = self.random.random() < birth_prob
+            if born:
+                self.make_ant("worker")
 
-            pheromone_cells = ant.smell_cells_for("food trail", self.surrounding_cells)
+        free_surrounding_cells = self.model.grid.empty_cells(self.surrounding_cells)
+        if (self.n_ants_inside or self.n_queens_inside) and free_surrounding_cells:
+            pheromone_cells = self.model.pheromone_map.smell("food trail", self.surrounding_cells)
             if list(pheromone_cells) and self.turn % ANTS_RELEASE_TURN == 0:
                 self.release_ant(pheromone_cells=pheromone_cells)
 
@@ -160,16 +339,44 @@ class Anthill(Agent):
 
 
 class AntsWorld(Model):
-    def __init__(self, N_food_sites, N_obstacles, width, height, food_spawn, torus, **kwargs):
+    def __init__(self, N_food_sites, N_obstacles, width, height, food_spawn, torus, pheromone_dtype=None,
+                 pheromone_path=None, seed=None, collect_every=1, events_path=None, events_every=0,
+                 fast_forward=False, profile=False, profile_log_every=0, **kwargs):
         super().__init__()
+        # every agent draws from this generator, so a run is replayed exactly from its seed
+        self._seed = seed
+        self.random = random.Random(seed)
         self.food_spawn = food_spawn
         self.N_obstacles = N_obstacles
         self.N_food_sites = N_food_sites
-        self.grid = SingleGrid(width, height, torus)
+        self.grid = AntsGrid(width, height, torus)
+        self.neighborhoods = NeighborhoodIndex(width, height, torus)
         self.schedule = RandomActivation(self)
-        self.pheromone_map = defaultdict(lambda: np.zeros((height, width)))
+        # layers in a memory mapped file (see MappedPheromoneMap) are float16 and those in memory float32,
+        # unless pheromone_dtype says otherwise
+        if pheromone_path:
+            dtype = np.float16 if pheromone_dtype is None else pheromone_dtype
+            self.pheromone_map = MappedPheromoneMap(width, height, pheromone_path, dtype)
+        else:
+            dtype = np.float32 if pheromone_dtype is None else pheromone_dtype
+            self.pheromone_map = PheromoneMap(width, height, dtype)
         self.species_list = []
         self.running = True
+        self.ants_outside = 0  # ants and queens on the grid
+        # skip the turns in which all ants rest inside, see fast_forward_turns; max_steps (set by the runners)
+        # is never skipped over
+        self.fast_forward = fast_forward
+        self.max_steps = None
+        self.collect_every = collect_every  # collect the data every collect_every-th step, never if 0
+        # births, deaths, colonies and food transport written to events_path as they happen, see events.py;
+        # the census of the species is logged every events_every-th step, never if 0
+        self.events = None
+        if events_path:
+            from events import EventLog
+            self.events = EventLog(events_path)
+        self.events_every = events_every
+        # calls and time of the hot paths, see instrumentation.py
+        self.profiler = Profiler(profile_log_every) if profile else None
 
         for i in range(len(list(kwargs)) // 3):
             if kwargs["include_{}".format(i)]:
@@ -180,42 +387,159 @@ class AntsWorld(Model):
                         id=i
                     )
                 )
+        self.species_by_id = {s.id: s for s in self.species_list}
+        self.census = np.zeros((len(self.species_list), len(CENSUS_FIELDS)))
+        self.bind_census()
         species_id = [s.id for s in self.species_list]
-        self.ants_collector = DataCollector(
-            model_reporters={"Species {}".format(s_id): (lambda id: (lambda model: count_ants(model, id)))(s_id)
-                             for s_id in species_id}
-        )
+        self.ants_collector = None
+        if collect_every:
+            from mesa.datacollection import DataCollector  # imports pandas, which headless runs can do without
+            self.ants_collector = DataCollector(
+                model_reporters={"Species {}".format(s_id): partial(count_ants, species_id=s_id)
+                                 for s_id in species_id}
+            )
 
         # Create agents
         for species in self.species_list:
-            pos = random.choice(list(self.grid.empties))
+            pos = self.grid.random_empty_cell(self.random)
             self.spawn_object(Anthill(self.next_id(), self, species, pos))
 
         for _ in range(self.N_food_sites):
-            pos = random.choice(list(self.grid.empties))
-            self.spawn_object(FoodSite(self.next_id(), self, random.randrange(FOOD_PER_FOOD_SITE), pos, 0))
+            pos = self.grid.random_empty_cell(self.random)
+            FoodSite(self.next_id(), self, self.random.randrange(FOOD_PER_FOOD_SITE), pos, 0).place()
         for _ in range(self.N_obstacles):
-            pos = random.choice(list(self.grid.empties))
+            pos = self.grid.random_empty_cell(self.random)
             self.spawn_object(Obstacle(self.next_id(), self, pos))
 
+    def bind_census(self):
+        for row, species in enumerate(self.species_list):
+            species.census = self.census[row]
+
+    # views of the census are copies once pickled
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bind_census()
+        if self.events is not None:  # the log of the saved model goes on in its own file
+            self.events.branch = str(self.schedule.steps)
+
+    # start drawing from a new seed (a branch of a snapshot)
+    def reseed(self, seed):
+        self._seed = seed
+        self.random = random.Random(seed)
+
+    # compressed binary snapshot of the whole simulation state, including generator states
+    def snapshot(self):
+        return zlib.compress(pickle.dumps(self, pickle.HIGHEST_PROTOCOL), SNAPSHOT_COMPRESSION)
+
+    @staticmethod
+    def restore(snapshot):
+        return pickle.loads(zlib.decompress(snapshot))
+
+    def save_snapshot(self, path):
+        with open(path, "wb") as f:
+            f.write(self.snapshot())
+
+    @staticmethod
+    def load_snapshot(path):
+        with open(path, "rb") as f:
+            return AntsWorld.restore(f.read())
+
+    # writes out and closes the files of the run: the event log and the file of a mapped pheromone map
+    def close(self):
+        if self.events is not None:
+            self.events.close()
+        self.pheromone_map.close()
+
+    # Independent copies of the current state. A copy with seed None continues exactly like this model.
+    # Every copy logs its events to a file of its own, numbered in the order of the seeds
+    def fork(self, seeds):
+        snapshot = self.snapshot()
+        branches = []
+        for i, seed in enumerate(seeds):
+            branch = AntsWorld.restore(snapshot)
+            if seed is not None:
+                branch.reseed(seed)
+            if branch.events is not None:
+                branch.events.branch = "{}-{}".format(self.schedule.steps, i)
+            branches.append(branch)
+        return branches
+
     def spawn_object(self, obj):
         self.schedule.add(obj)
         self.grid.place_agent(obj, obj.pos)
 
     def evaporate_pheromone(self):
-        for k in self.pheromone_map.keys():
-            self.pheromone_map[k][self.pheromone_map[k] > 0] -= 1
+        self.pheromone_map.evaporate()
 
-    def step(self):
+    def collect_data(self):
         self.ants_collector.collect(self)
+
+    def log_event(self, event, agent, pos=None, value=None):
+        self.events.emit(self.schedule.steps, event, agent.species.id, agent.unique_id, pos, value)
+
+    def log_census(self):
+        for species in self.species_list:
+            for field, value in zip(CENSUS_FIELDS, species.census.tolist()):
+                self.events.emit(self.schedule.steps, "census " + field, species.id, value=value)
+
+    # Number of the coming turns in which nothing can happen but feeding of the residents and evaporation,
+    # while there are no ants outside. The next turn with a possible event is a normal step. Anthills which
+    # drew their next birth in advance are told whether it is in that turn; births drawn for later turns
+    # are dropped, the draws are memoryless.
+    def fast_forward_turns(self):
+        steps = self.schedule.steps
+        limit = self.max_steps - steps if self.max_steps is not None else math.inf
+        for every in (self.food_spawn, self.events_every):
+            if every:
+                limit = min(limit, every - steps % every)
+        anthills = [anthill for species in self.species_list for anthill in species.anthills]
+        event = min([limit] + [anthill.next_event(limit) for anthill in anthills])
+        if event == math.inf:
+            return 0
+        for anthill in anthills:
+            if anthill.next_birth is not None:
+                anthill.drawn_birth = anthill.turn + event, anthill.next_birth == event
+        return event - 1
+
+    # Turns without anything happening in closed form: upkeep of the anthills, evaporation, and the rows of
+    # the data collector, which repeat the row of the first skipped turn (no census changes while quiet)
+    def skip_turns(self, turns):
+        steps = self.schedule.steps
+        if self.collect_every:
+            collections = (steps + turns - 1) // self.collect_every - (steps - 1) // self.collect_every
+            if collections:
+                self.collect_data()
+                for values in self.ants_collector.model_vars.values():
+                    values.extend([values[-1]] * (collections - 1))
+        for species in self.species_list:
+            for anthill in species.anthills:
+                anthill.skip(turns)
+        self.pheromone_map.evaporate(turns)
+        self.schedule.steps += turns
+        self.schedule.time += turns
+
+    def step(self):
+        if self.fast_forward and not self.ants_outside:
+            turns = self.fast_forward_turns()
+            if turns:
+                self.skip_turns(turns)
+        if self.collect_every and self.schedule.steps % self.collect_every == 0:
+            self.collect_data()
         self.schedule.step()
         self.evaporate_pheromone()
 
         if self.food_spawn and self.schedule.steps % self.food_spawn == 0:
-            pos = random.choice(list(self.grid.empties))
-            self.spawn_object(FoodSite(self.next_id(), self, random.randrange(FOOD_PER_FOOD_SITE), pos, r_rate=0))
+            pos = self.grid.random_empty_cell(self.random)
+            FoodSite(self.next_id(), self, self.random.randrange(FOOD_PER_FOOD_SITE), pos, r_rate=0).place()
 
-        anthills = np.array([len(species.anthills) for species in self.species_list])
-        if np.sum(anthills > 0) <= 1:
+        if self.events_every and self.schedule.steps % self.events_every == 0:
+            self.log_census()
+
+        if np.count_nonzero(self.census[:, ANTHILLS]) <= 1:
             self.running = False
+            if self.events is not None:
+                self.events.flush()
+
+        if self.profiler is not None:
+            self.profiler.on_step(self)
 
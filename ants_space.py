@@ -0,0 +1,150 @@
+from mesa.space import SingleGrid
+import numpy as np
+
+ORIENTATIONS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+MOORE_OFFSETS = ORIENTATIONS
+VON_NEUMANN_OFFSETS = [(-1, 0), (0, -1), (0, 1), (1, 0)]
+RANDOM_CELL_TRIES = 32  # random cells drawn before falling back to listing all empty cells
+# kinds of cells in AntsGrid.kinds; a cell with an ant holds ANT_KIND + id of its species
+EMPTY_KIND, BLOCKED_KIND, FOOD_KIND, ANT_KIND = range(4)
+
+
+# offsets of the straight path field of an ant going in the given direction
+def field_offsets(orient, field):
+    dx, dy = orient
+    if field == "narrow":  # 3 cells in front
+        return [(x, y) for x, y in MOORE_OFFSETS if abs(x - dx) + abs(y - dy) <= 1]
+    elif field == "wide":  # 3 cells in front + 2 cells at sides
+        return [(x, y) for x, y in MOORE_OFFSETS if abs(x + dx) + abs(y + dy) > 1]
+
+
+# for every cell of the wide field, indices of the cells of the field next to it (von Neumann neighbourhood)
+FIELD_ADJACENCY = {orient: [[j for j, (x2, y2) in enumerate(offsets) if abs(x2 - x1) + abs(y2 - y1) == 1]
+                            for x1, y1 in offsets]
+                   for orient, offsets in ((orient, field_offsets(orient, "wide")) for orient in ORIENTATIONS)}
+OFFSETS = {"moore": MOORE_OFFSETS, "von_neumann": VON_NEUMANN_OFFSETS}
+OFFSETS.update({(field, orient): field_offsets(orient, field)
+                for field in ("narrow", "wide") for orient in ORIENTATIONS})
+
+
+# Neighbourhoods and straight path fields of every cell, built once per world.
+# All of them lie within one step, so cells off the border of the map only need the offset tables;
+# cells on the border have their wrapped (torus) or clipped neighbourhoods precomputed.
+class NeighborhoodIndex:
+    def __init__(self, width, height, torus):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.border = {}
+        border_cells = {(x, y) for x in range(width) for y in (0, height - 1)}
+        border_cells |= {(x, y) for x in (0, width - 1) for y in range(height)}
+        for pos in border_cells:
+            self.border[pos] = {kind: self.adjust(pos, offsets) for kind, offsets in OFFSETS.items()}
+        # Moore neighbourhoods as flat cell ids (x * height + y), matching AntsGrid.kinds
+        self.flat_offsets = [dx * height + dy for dx, dy in MOORE_OFFSETS]
+        self.flat_border = {pos: [x * height + y for x, y in cells["moore"]] for pos, cells in self.border.items()}
+
+    # the index is rebuilt instead of being stored in snapshots
+    def __getstate__(self):
+        return self.width, self.height, self.torus
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    # cells at the given offsets, wrapped on a torus or without the ones outside the map
+    def adjust(self, pos, offsets):
+        cells = []
+        for dx, dy in offsets:
+            x, y = pos[0] + dx, pos[1] + dy
+            if self.torus:
+                x, y = x % self.width, y % self.height
+            elif not (0 <= x < self.width and 0 <= y < self.height):
+                continue
+            if (x, y) != pos and (x, y) not in cells:
+                cells.append((x, y))
+        return cells
+
+    def lookup(self, pos, kind):
+        border = self.border.get(pos)
+        if border is not None:
+            return border[kind]
+        x, y = pos
+        return [(x + dx, y + dy) for dx, dy in OFFSETS[kind]]
+
+    def neighborhood(self, pos, moore=True):
+        return self.lookup(pos, "moore" if moore else "von_neumann")
+
+    def field(self, pos, orient, field):
+        return self.lookup(pos, (field, orient))
+
+    def flat_neighborhood(self, pos):
+        cells = self.flat_border.get(pos)
+        if cells is not None:
+            return cells
+        cell = pos[0] * self.height + pos[1]
+        return [cell + offset for offset in self.flat_offsets]
+
+    # FIELD_ADJACENCY of the wide field of the cell, if its cells are the whole stencil in the order of the offsets.
+    # That is every cell of a torus of at least 4x4 and the cells off the border of other maps
+    def field_adjacency(self, pos, orient):
+        if self.torus:
+            if self.width >= 4 and self.height >= 4:
+                return FIELD_ADJACENCY[orient]
+        elif pos not in self.border:
+            return FIELD_ADJACENCY[orient]
+        return None
+
+
+# SingleGrid with an occupancy bitmap and the kind of every cell kept in sync with placing, moving and
+# removing agents. Kinds are a flat bytearray (cell x * height + y) for quick checks of single cells.
+class AntsGrid(SingleGrid):
+    def __init__(self, width, height, torus):
+        super().__init__(width, height, torus)
+        self.occupied = np.zeros((width, height), dtype=bool)
+        self.n_occupied = 0
+        self.kinds = bytearray(width * height)
+
+    # snapshots keep only the agents; the cell lists and the set of empty cells are rebuilt from the bitmap
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["empties"]
+        state["grid"] = [(x, y, self.grid[x][y]) for x, y in np.argwhere(self.occupied).tolist()]
+        return state
+
+    def __setstate__(self, state):
+        agents = state.pop("grid")
+        self.__dict__.update(state)
+        self.grid = [[self.default_val() for _ in range(self.height)] for _ in range(self.width)]
+        for x, y, agent in agents:
+            self.grid[x][y] = agent
+        self.empties = set(map(tuple, np.argwhere(~self.occupied).tolist()))
+
+    def _place_agent(self, pos, agent):
+        super()._place_agent(pos, agent)
+        self.occupied[pos] = True
+        self.n_occupied += 1
+        self.kinds[pos[0] * self.height + pos[1]] = getattr(agent, "cell_kind", BLOCKED_KIND)
+
+    def _remove_agent(self, pos, agent):
+        super()._remove_agent(pos, agent)
+        self.occupied[pos] = False
+        self.n_occupied -= 1
+        self.kinds[pos[0] * self.height + pos[1]] = EMPTY_KIND
+
+    def is_cell_empty(self, pos):
+        return not self.occupied[pos]
+
+    def empty_cells(self, cells):
+        occupied = self.occupied
+        return [cell for cell in cells if not occupied[cell]]
+
+    # uniformly drawn empty cell. Rejection sampling is O(1) unless the map is nearly full
+    def random_empty_cell(self, rng):
+        if self.n_occupied >= self.width * self.height:
+            raise Exception("ERROR: Grid full")
+        for _ in range(RANDOM_CELL_TRIES):
+            pos = rng.randrange(self.width), rng.randrange(self.height)
+            if not self.occupied[pos]:
+                return pos
+        cell = rng.choice(np.flatnonzero(~self.occupied).tolist())
+        return divmod(cell, self.height)
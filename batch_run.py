@@ -1,9 +1,9 @@
 from ants_model import *
-from mesa.batchrunner import BatchRunner
-from mesa.visualization.UserParam import UserSettableParameter
-import pandas
+from batch_runner import ParallelBatchRunner
+from result_cache import ResultCache
 width = height = 50
 MAX_N_SPECIES = 4
+PROCESSES = None  # number of worker processes, all cores if None
 
 labels = ["Species {}".format(s_id) for s_id in range(MAX_N_SPECIES)]
 
@@ -27,13 +27,25 @@ for i in range(1, MAX_N_SPECIES):
          "reproduction_rate_{}".format(i): [3],
          "ant_size_{}".format(i): [3]})
 
-batch_run = BatchRunner(AntsWorld,
-                        variable_params,
-                        fixed_params,
-                        iterations=80,
-                        max_steps=1500,
-                        model_reporters={"ants": lambda m: [len(species.anthills) for species in m.species_list],
-                                         "turn": lambda m: m.schedule.steps})
-batch_run.run_all()
-data_collector_agents = batch_run.get_model_vars_dataframe()
-data_collector_agents.to_excel("ant_0_is_strongest_others_strong.xlsx")
+
+def count_anthills(m):
+    return [len(species.anthills) for species in m.species_list]
+
+
+def count_turns(m):
+    return m.schedule.steps
+
+
+if __name__ == "__main__":
+    batch_run = ParallelBatchRunner(AntsWorld,
+                                    variable_params,
+                                    fixed_params,
+                                    iterations=80,
+                                    max_steps=1500,
+                                    model_reporters={"ants": count_anthills,
+                                                     "turn": count_turns},
+                                    output_path="ant_0_is_strongest_others_strong.csv",
+                                    processes=PROCESSES,
+                                    cache=ResultCache())
+    batch_run.run_all()
+    print("result cache:", batch_run.cache.stats)
@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import hashlib
+import itertools
+import json
+import os
+
+
+# canonical key of a run, independent of the order of the sweep
+def run_key(params, iteration):
+    canonical = json.dumps({"params": params, "iteration": iteration}, sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def run_seed(base_seed, key):
+    return int(hashlib.sha1("{}:{}".format(base_seed, key).encode()).hexdigest()[:8], 16)
+
+
+# executed in the worker processes
+def run_model(model_cls, params, max_steps, model_reporters, seed):
+    model = model_cls(seed=seed, **params)
+    model.max_steps = max_steps
+    try:
+        while model.running and model.schedule.steps < max_steps:
+            model.step()
+        return {name: reporter(model) for name, reporter in model_reporters.items()}
+    finally:
+        model.close()
+
+
+def encode(value):
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value)
+    return value
+
+
+# Replacement of mesa's BatchRunner which runs the sweep on a pool of processes.
+# Every finished run is appended to a csv file right away; runs already in the file are skipped,
+# so an interrupted sweep is resumed by running it again. Reporters have to be picklable (module level functions).
+# With a ResultCache (see result_cache.py) runs done before, by any sweep, are taken from the cache.
+class ParallelBatchRunner:
+    def __init__(self, model_cls, variable_parameters=None, fixed_parameters=None, iterations=1, max_steps=1000,
+                 model_reporters=None, output_path="batch_results.csv", processes=None, seed=0, cache=None):
+        self.model_cls = model_cls
+        self.variable_parameters = variable_parameters or {}
+        self.fixed_parameters = fixed_parameters or {}
+        self.iterations = iterations
+        self.max_steps = max_steps
+        self.model_reporters = model_reporters or {}
+        self.output_path = output_path
+        self.processes = processes or os.cpu_count()
+        self.seed = seed
+        self.cache = cache
+
+    def runs(self):
+        names = list(self.variable_parameters)
+        for values in itertools.product(*(self.variable_parameters[name] for name in names)):
+            variable = dict(zip(names, values))
+            for iteration in range(self.iterations):
+                key = run_key({**self.fixed_parameters, **variable}, iteration)
+                yield key, variable, iteration, run_seed(self.seed, key)
+
+    def done_runs(self):
+        if not os.path.exists(self.output_path):
+            return set()
+        with open(self.output_path, newline="") as f:
+            return {row["run"] for row in csv.DictReader(f)}
+
+    def fieldnames(self):
+        return ["run", "iteration", "seed"] + list(self.variable_parameters) + list(self.model_reporters)
+
+    def run_all(self):
+        done = self.done_runs()
+        todo = [run for run in self.runs() if run[0] not in done]
+        new_file = not os.path.exists(self.output_path)
+        with open(self.output_path, "a", newline="") as f, ProcessPoolExecutor(self.processes) as pool:
+            writer = csv.DictWriter(f, self.fieldnames())
+            if new_file:
+                writer.writeheader()
+
+            def write(key, variable, iteration, seed, result):
+                row = {"run": key, "iteration": iteration, "seed": seed}
+                row.update({name: encode(value) for name, value in variable.items()})
+                row.update({name: encode(value) for name, value in result.items()})
+                writer.writerow(row)
+                f.flush()
+
+            futures = {}
+            for key, variable, iteration, seed in todo:
+                params = {**self.fixed_parameters, **variable}
+                cache_key = None
+                if self.cache is not None:
+                    cache_key = self.cache.key(self.model_cls, params, seed, self.max_steps, self.model_reporters)
+                    result = self.cache.get(cache_key)
+                    if result is not None:
+                        write(key, variable, iteration, seed, result)
+                        continue
+                future = pool.submit(run_model, self.model_cls, params, self.max_steps, self.model_reporters, seed)
+                futures[future] = key, variable, iteration, seed, cache_key
+            for future in as_completed(futures):
+                key, variable, iteration, seed, cache_key = futures[future]
+                result = future.result()
+                if cache_key is not None:
+                    self.cache.put(cache_key, result)
+                write(key, variable, iteration, seed, result)
+        return len(todo)
@@ -0,0 +1,133 @@
+# Benchmark of AntsWorld throughput and memory.
+# Every scenario runs in a fresh process with a fixed seed; results are written to a json file
+# together with the current commit, so runs of different commits can be compared.
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+
+def world_params(size, n_species, obstacle_density, n_food_sites, food_spawn, reproduction_rate=3, ant_size=3):
+    params = {
+        "N_food_sites": n_food_sites,
+        "N_obstacles": int(obstacle_density * size * size),
+        "width": size,
+        "height": size,
+        "food_spawn": food_spawn,
+        "torus": True,
+    }
+    for i in range(n_species):
+        params.update({"include_{}".format(i): True,
+                       "reproduction_rate_{}".format(i): reproduction_rate,
+                       "ant_size_{}".format(i): ant_size})
+    return params
+
+
+SCENARIOS = {
+    # the defaults of server.py
+    "small": dict(params=world_params(50, 2, 0.04, 10, 10), steps=500),
+    "medium": dict(params=world_params(200, 3, 0.02, 100, 5), steps=500),
+    "huge": dict(params=world_params(1000, 4, 0.01, 1000, 1), steps=200),
+    "dense_obstacles": dict(params=world_params(100, 2, 0.3, 40, 10), steps=500),
+    # a lot of food close by: ants mostly follow trails (go_down_the_trail)
+    "trails": dict(params=world_params(40, 2, 0.0, 80, 2), steps=500),
+    # little food: ants rely on foraging parties
+    "foraging": dict(params=world_params(100, 2, 0.02, 3, 0), steps=500),
+    # frequent queen seasons and a lot of food for new colonies
+    "queens": dict(params=world_params(100, 4, 0.02, 150, 3, reproduction_rate=5, ant_size=2), steps=800),
+}
+SEED = 0
+
+
+def timed(phases, name, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        phases[name] += time.perf_counter() - start
+        return result
+    return wrapper
+
+
+# executed in a fresh process, so the peak memory belongs to the scenario
+def run_scenario(name, params, steps):
+    import ants_model
+
+    start = time.perf_counter()
+    model = ants_model.AntsWorld(seed=SEED, **params)
+    setup_time = time.perf_counter() - start
+
+    phases = {"schedule": 0.0, "evaporation": 0.0, "collection": 0.0}
+    model.schedule.step = timed(phases, "schedule", model.schedule.step)
+    model.evaporate_pheromone = timed(phases, "evaporation", model.evaporate_pheromone)
+    model.ants_collector.collect = timed(phases, "collection", model.ants_collector.collect)
+
+    # turns of the ants outside; obstacles and anthills are scheduled too, but they don't count as agent-steps
+    agent_steps = 0
+    start = time.perf_counter()
+    while model.running and model.schedule.steps < steps:
+        agent_steps += model.ants_outside
+        model.step()
+    run_time = time.perf_counter() - start
+
+    return {
+        "scenario": name,
+        "steps": model.schedule.steps,
+        "setup_s": setup_time,
+        "run_s": run_time,
+        "steps_per_s": model.schedule.steps / run_time,
+        "agent_steps_per_s": agent_steps / run_time,
+        "phases_s": phases,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "pheromone_mb": model.pheromone_map.nbytes / 2 ** 20,
+        "workers": model.census[:, ants_model.WORKERS].tolist(),
+        "anthills": model.census[:, ants_model.ANTHILLS].tolist(),
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AntsWorld scenarios")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--steps", type=int, help="override the number of steps of every scenario")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios:
+        scenario = SCENARIOS[name]
+        steps = args.steps or scenario["steps"]
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(run_scenario, name, scenario["params"], steps).result()
+        results.append(result)
+        print("{scenario:>16}: {steps:>5} steps {steps_per_s:>8.1f} steps/s {agent_steps_per_s:>10.0f} agent-steps/s "
+              "{peak_rss_mb:>7.1f} MB peak".format(**result))
+        phases = ", ".join("{} {:.2f}s".format(phase, t) for phase, t in result["phases_s"].items())
+        print("{:>16}  {}".format("", phases))
+
+    report = {
+        "commit": commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Micro-benchmark of pheromone evaporation on sparse trails.
+# A fixed number of walkers lay trails on maps of growing size; the active-cell evaporation
+# of PheromoneMap is compared with the dense `layer[layer > 0] -= 1` decay over the whole map.
+from pheromones import PheromoneMap
+import numpy as np
+import time
+
+GRID_SIZES = [50, 100, 200, 500, 1000, 2000]
+N_WALKERS = 200
+N_STEPS = 200
+MAX_DEPOSIT = 60
+MAX_STRENGTH = 100
+
+
+def run(size, dense, seed=0):
+    rng = np.random.default_rng(seed)
+    pheromone_map = PheromoneMap(size, size)
+    walkers = rng.integers(0, size, (N_WALKERS, 2))
+    start = time.perf_counter()
+    for _ in range(N_STEPS):
+        walkers = (walkers + rng.integers(-1, 2, walkers.shape)) % size
+        for pos, strength in zip(walkers.tolist(), rng.uniform(0, MAX_DEPOSIT, N_WALKERS).tolist()):
+            pheromone_map.deposit("food trail", pos, strength, MAX_STRENGTH)
+        if dense:
+            layers = pheromone_map.layers
+            layers[layers > 0] -= 1
+        else:
+            pheromone_map.evaporate()
+    return (time.perf_counter() - start) / N_STEPS, pheromone_map
+
+
+def main():
+    print("{:>6} {:>14} {:>14} {:>9} {:>12}".format("size", "dense ms/step", "sparse ms/step", "speedup",
+                                                      "active cells"))
+    for size in GRID_SIZES:
+        dense_time, dense_map = run(size, dense=True)
+        sparse_time, sparse_map = run(size, dense=False)
+        assert np.array_equal(dense_map.layers, sparse_map.layers), "evaporation results differ"
+        print("{:>6} {:>14.3f} {:>14.3f} {:>9.1f} {:>12}".format(size, dense_time * 1000, sparse_time * 1000,
+                                                                   dense_time / sparse_time, sparse_map.n_active()))
+
+
+if __name__ == "__main__":
+    main()
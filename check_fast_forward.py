@@ -0,0 +1,97 @@
+# Check that fast_forward leaves the results of AntsWorld unchanged.
+# A fast forward draws the births of the turns it skips in advance, so single runs with and without it differ;
+# over many seeds the census at the end and the series of the data collector have to agree. Every statistic
+# is compared with Welch's t, and the script exits with 1 if one of them is off by more than MAX_T standard
+# errors, or if a run collected the wrong number of rows.
+#   python check_fast_forward.py --seeds 400
+from benchmark import world_params
+import argparse
+import math
+import statistics
+import sys
+
+SCENARIOS = {
+    # colonies without food around, most of the turns are skipped; births are the main event
+    "resting": dict(params=world_params(50, 2, 0.04, 0, 0, reproduction_rate=1, ant_size=5), steps=30),
+    # the same over the first foraging parties, which end the jumps
+    "quiet": dict(params=world_params(50, 2, 0.04, 0, 0, reproduction_rate=1, ant_size=5), steps=100),
+    # queen seasons every 60 turns: queens resting inside and starving there stop the jumps
+    "queens": dict(params=world_params(50, 2, 0.04, 0, 0, reproduction_rate=5, ant_size=5), steps=150),
+}
+MAX_T = 4.0  # with a few dozen statistics a false alarm at this level is about one in a thousand
+
+
+# statistics of one run by name, and the fraction of the turns which were skipped
+def run(params, steps, seed, fast_forward):
+    import ants_model
+
+    model = ants_model.AntsWorld(seed=seed, fast_forward=fast_forward, **params)
+    model.max_steps = steps
+    calls = 0
+    while model.running and model.schedule.steps < steps:
+        model.step()
+        calls += 1
+
+    stats = {}
+    for i, species in enumerate(model.species_list):
+        for field, value in zip(ants_model.CENSUS_FIELDS, species.census.tolist()):
+            stats["species {} {}".format(i, field)] = value
+    rows = 0
+    for name, values in model.ants_collector.model_vars.items():
+        stats["{} mean".format(name)] = statistics.mean(values)
+        stats["{} last".format(name)] = values[-1]
+        rows = len(values)
+    model.close()
+    expected_rows = model.schedule.steps  # one row at the start of every step
+    return stats, rows == expected_rows, 1 - calls / model.schedule.steps
+
+
+def welch_t(a, b):
+    diff = statistics.mean(a) - statistics.mean(b)
+    error = math.sqrt(statistics.variance(a) / len(a) + statistics.variance(b) / len(b))
+    if error == 0:
+        return 0.0 if diff == 0 else math.inf
+    return diff / error
+
+
+def check(name, scenario, seeds):
+    runs = {}
+    rows_ok = True
+    skipped = 0.0
+    for fast_forward in (False, True):
+        results = [run(scenario["params"], scenario["steps"], seed, fast_forward) for seed in range(seeds)]
+        runs[fast_forward] = [stats for stats, _, _ in results]
+        rows_ok &= all(ok for _, ok, _ in results)
+        if fast_forward:
+            skipped = statistics.mean(fraction for _, _, fraction in results)
+
+    print("{}: {} steps, {} seeds, {:.0%} of the turns skipped".format(name, scenario["steps"], seeds, skipped))
+    failed = not rows_ok
+    if not rows_ok:
+        print("  the data collector has the wrong number of rows")
+    for stat in runs[False][0]:
+        normal = [stats[stat] for stats in runs[False]]
+        skipping = [stats[stat] for stats in runs[True]]
+        t = welch_t(normal, skipping)
+        mark = "" if abs(t) <= MAX_T else "  <-- differs"
+        failed |= abs(t) > MAX_T
+        print("  {:>32}: {:>9.3f} {:>9.3f}  t {:>6.2f}{}".format(
+            stat, statistics.mean(normal), statistics.mean(skipping), t, mark))
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare AntsWorld runs with and without fast_forward")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--seeds", type=int, default=400, help="runs of every scenario in each mode")
+    args = parser.parse_args()
+
+    ok = True
+    for name in args.scenarios:
+        ok &= check(name, SCENARIOS[name], args.seeds)
+    print("fast forward matches normal stepping" if ok else "fast forward differs from normal stepping")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from mesa.visualization.ModularVisualization import VisualizationElement
+import base64
+import json
+import numpy as np
+
+HEATMAP_SIZE = 100  # the heatmap is downsampled to at most HEATMAP_SIZE x HEATMAP_SIZE cells
+
+
+# Canvas of the grid which sends the browser only what changed since the previous frame.
+# Portrayals are turned into styles sent once and referred to by number; the agents of static_types
+# (e.g. obstacles) are sent only in the first frame of a model. Afterwards a frame lists the agents
+# moved ([id, x, y]), added ([id, x, y, style, text]) and removed (id), and the new texts of labelled
+# agents ([id, text]). The portrayal of an agent without a text is computed only once.
+# A heatmap of the pheromone layer `heatmap` is added every heatmap_every-th step: the strongest cell of
+# each block, as bytes 0-255 in base64. The browser keeps the state, so one model is viewed by one page.
+class DeltaCanvasGrid(VisualizationElement):
+    local_includes = ["DeltaCanvasModule.js"]
+
+    def __init__(self, portrayal_method, grid_width, grid_height, canvas_width=500, canvas_height=500,
+                 static_types=(), heatmap=None, heatmap_every=10, heatmap_color="0,120,255"):
+        self.portrayal_method = portrayal_method
+        self.static_types = tuple(static_types)
+        self.heatmap = heatmap
+        self.heatmap_every = heatmap_every
+        self.model = None
+        self.js_code = "elements.push(new DeltaCanvasModule({}, {}, {}, {}, \"{}\"));".format(
+            canvas_width, canvas_height, grid_width, grid_height, heatmap_color)
+
+    def style(self, portrayal):
+        style = {key: value for key, value in portrayal.items() if key != "text"}
+        key = json.dumps(style, sort_keys=True)
+        if key not in self.styles:
+            self.styles[key] = len(self.styles)
+            self.new_styles[self.styles[key]] = style
+        return self.styles[key]
+
+    def agents(self, model):
+        grid = model.grid.grid
+        for x, y in np.argwhere(model.grid.occupied).tolist():
+            yield grid[x][y], x, y
+
+    def full_frame(self, model):
+        self.model = model
+        self.styles = {}
+        self.new_styles = {}
+        self.shown = {}  # unique_id -> [x, y, style, text, labelled]
+        static = []
+        for agent, x, y in self.agents(model):
+            if isinstance(agent, self.static_types):
+                portrayal = self.portrayal_method(agent)
+                if portrayal:
+                    static.append([x, y, self.style(portrayal)])
+        frame = self.delta_frame(model)
+        frame.update(full=True, static=static)
+        return frame
+
+    def delta_frame(self, model):
+        moved, added, labels = [], [], []
+        seen = set()
+        for agent, x, y in self.agents(model):
+            if isinstance(agent, self.static_types):
+                continue
+            uid = agent.unique_id
+            seen.add(uid)
+            shown = self.shown.get(uid)
+            if shown is None:
+                portrayal = self.portrayal_method(agent)
+                if not portrayal:
+                    continue
+                text = portrayal.get("text")
+                self.shown[uid] = [x, y, self.style(portrayal), text, text is not None]
+                added.append([uid, x, y, self.shown[uid][2], text])
+                continue
+            if shown[0] != x or shown[1] != y:
+                shown[0], shown[1] = x, y
+                moved.append([uid, x, y])
+            if shown[4]:
+                text = self.portrayal_method(agent).get("text")
+                if text != shown[3]:
+                    shown[3] = text
+                    labels.append([uid, text])
+        removed = [uid for uid in self.shown if uid not in seen]
+        for uid in removed:
+            del self.shown[uid]
+        frame = {"moved": moved, "added": added, "removed": removed, "labels": labels, "styles": self.new_styles}
+        self.new_styles = {}
+        return frame
+
+    def heatmap_frame(self, model):
+        pheromone_map = model.pheromone_map
+        if self.heatmap not in pheromone_map:
+            return None
+        layer = np.asarray(pheromone_map[self.heatmap], dtype=np.float32)
+        width, height = layer.shape
+        block = max(1, -(-max(width, height) // HEATMAP_SIZE))
+        padded = np.zeros((-(-width // block) * block, -(-height // block) * block), dtype=np.float32)
+        padded[:width, :height] = layer
+        blocks = padded.reshape(padded.shape[0] // block, block, padded.shape[1] // block, block).max(axis=(1, 3))
+        top = blocks.max()
+        values = (blocks / top * 255).astype(np.uint8) if top > 0 else blocks.astype(np.uint8)
+        return {"width": values.shape[0], "height": values.shape[1], "block": block,
+                "data": base64.b64encode(values.tobytes()).decode("ascii")}
+
+    def render(self, model):
+        if model is not self.model or model.schedule.steps == 0:
+            frame = self.full_frame(model)
+        else:
+            frame = self.delta_frame(model)
+        if self.heatmap is not None and (frame.get("full") or model.schedule.steps % self.heatmap_every == 0):
+            frame["heatmap"] = self.heatmap_frame(model)
+        return frame
@@ -0,0 +1,81 @@
+import csv
+import os
+
+# columns of the event stream; pos is split into x and y, value is e.g. the food carried or a census number
+COLUMNS = ("step", "event", "species", "agent", "x", "y", "value")
+CHUNK_SIZE = 10000  # events buffered before they are written out
+
+
+# Stream of the events of one run (births, deaths, colony foundations and destructions, food pickups and
+# deliveries, periodic census of the species), written in chunks so that a long run never holds its history.
+# A path ending with .parquet is written with pyarrow, any other path as csv.
+# Snapshots carry only the path. A restored log never writes to the file of the log it was saved from, which
+# goes on with the original run: it starts a file of its own named after its branch, see branch_path.
+class EventLog:
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.parquet = path.endswith(".parquet")
+        if self.parquet:
+            import pyarrow  # raises early if the optional dependency is missing
+        self.buffer = []
+        self.writer = None
+        self.file = None
+        self.branch = None  # set on restored logs, e.g. "250" (restored at step 250) or "250-1" (second fork)
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        state.update(writer=None, file=None, buffer=[])
+        return state
+
+    # the path with the branch before the extension: events.csv restored at step 250 writes events-250.csv
+    def branch_path(self):
+        if self.branch is None:
+            return self.path
+        stem, ext = os.path.splitext(self.path)
+        return "{}-{}{}".format(stem, self.branch, ext)
+
+    def emit(self, step, event, species=None, agent=None, pos=None, value=None):
+        x, y = pos if pos is not None else (None, None)
+        self.buffer.append((step, event, species, agent, x, y, value))
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def open(self):
+        if self.parquet:
+            import pyarrow
+            import pyarrow.parquet
+            schema = pyarrow.schema([("step", pyarrow.int64()), ("event", pyarrow.string()),
+                                     ("species", pyarrow.int64()), ("agent", pyarrow.int64()),
+                                     ("x", pyarrow.int64()), ("y", pyarrow.int64()), ("value", pyarrow.float64())])
+            self.writer = pyarrow.parquet.ParquetWriter(self.branch_path(), schema)
+        else:
+            self.file = open(self.branch_path(), "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.writer is None:
+            self.open()
+        if self.parquet:
+            import pyarrow
+            columns = list(zip(*self.buffer))
+            self.writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=self.writer.schema.field(i).type) for i, column in enumerate(columns)],
+                schema=self.writer.schema))
+        else:
+            self.writer.writerows(self.buffer)
+            self.file.flush()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.parquet and self.writer is not None:
+            self.writer.close()
+        if self.file is not None:
+            self.file.close()
+        self.writer = None
+        self.file = None
@@ -0,0 +1,104 @@
+# Run AntsWorld without the visualization server:
+#   python headless.py --steps 1500 --seed 1 --param N_obstacles=300 --param include_2=true
+# Parameters come from the defaults below, then a json config file (--config), then --param options.
+# Only the model code is imported, so the start up is quick enough to launch many short runs.
+import argparse
+import json
+import sys
+import time
+
+MAX_N_SPECIES = 4
+
+# the defaults of the sliders in server.py
+DEFAULT_PARAMS = {
+    "N_food_sites": 10,
+    "N_obstacles": 100,
+    "width": 50,
+    "height": 50,
+    "food_spawn": 10,
+    "torus": True,
+}
+for i in range(MAX_N_SPECIES):
+    DEFAULT_PARAMS.update({"include_{}".format(i): i <= 1,
+                           "reproduction_rate_{}".format(i): 3,
+                           "ant_size_{}".format(i): 3})
+
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run AntsWorld headless")
+    parser.add_argument("--steps", type=int, default=1000, help="maximal number of steps")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--config", help="json file with model parameters")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="model parameter, the value is parsed as json if possible")
+    parser.add_argument("--collect-every", type=int, default=0,
+                        help="collect the data collector every N steps (off by default)")
+    parser.add_argument("--fast-forward", action="store_true",
+                        help="skip over the turns in which all ants rest inside their anthills")
+    parser.add_argument("--pheromone-path", help="keep the pheromone layers in this memory mapped file")
+    parser.add_argument("--pheromone-dtype", choices=["float16", "float32", "float64"],
+                        help="dtype of the pheromone layers (default float16 with --pheromone-path, else float32)")
+    parser.add_argument("--events", help="write the event stream to this csv (or .parquet) file")
+    parser.add_argument("--events-every", type=int, default=0, help="log the census every N steps (off by default)")
+    parser.add_argument("--output", help="write the summary as json to this file instead of printing it")
+    return parser.parse_args(argv)
+
+
+def model_params(args):
+    params = dict(DEFAULT_PARAMS)
+    if args.config:
+        with open(args.config) as f:
+            params.update(json.load(f))
+    for param in args.param:
+        name, _, value = param.partition("=")
+        params[name] = parse_value(value)
+    if args.pheromone_path:
+        params["pheromone_path"] = args.pheromone_path
+    if args.pheromone_dtype:
+        params["pheromone_dtype"] = args.pheromone_dtype
+    params.update(seed=args.seed, collect_every=args.collect_every, events_path=args.events,
+                  events_every=args.events_every, fast_forward=args.fast_forward)
+    return params
+
+
+def summary(model, run_time):
+    import ants_model
+    return {
+        "steps": model.schedule.steps,
+        "running": model.running,
+        "run_s": run_time,
+        "steps_per_s": model.schedule.steps / run_time if run_time else None,
+        "species": {"Species {}".format(species.id): dict(zip(ants_model.CENSUS_FIELDS, species.census.tolist()))
+                    for species in model.species_list},
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import ants_model
+
+    model = ants_model.AntsWorld(**model_params(args))
+    model.max_steps = args.steps
+    start = time.perf_counter()
+    while model.running and model.schedule.steps < args.steps:
+        model.step()
+    result = summary(model, time.perf_counter() - start)
+    model.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from time import perf_counter
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (module, class, method, label) of the instrumented hot paths
+INSTRUMENTED = [
+    ("ant_agent", "Ant", "step", "ant step"),
+    ("ant_agent", "Ant", "act", "ant act"),
+    ("ant_agent", "Ant", "attack", "ant attack"),
+    ("ant_agent", "Ant", "take_food", "ant take food"),
+    ("ant_agent", "Ant", "go_down_the_trail", "ant follow trail"),
+    ("ant_agent", "Ant", "go_forage", "ant forage"),
+    ("ant_agent", "Ant", "go_random", "ant random walk"),
+    ("ant_agent", "Ant", "enter_anthill", "ant enter anthill"),
+    ("ant_agent", "Queen", "act", "queen act"),
+    ("ant_agent", "Queen", "start_new_colony", "queen start colony"),
+    ("ants_model", "Anthill", "step", "anthill step"),
+    ("ants_model", "Anthill", "feed_residents", "anthill feed"),
+    ("ants_model", "Anthill", "release_ant", "anthill release"),
+    ("ants_model", "Anthill", "make_ant", "anthill birth"),
+    ("ants_model", "AntsWorld", "step", "world step"),
+    ("ants_model", "AntsWorld", "evaporate_pheromone", "evaporation"),
+    ("ants_model", "AntsWorld", "collect_data", "data collection"),
+]
+installed = False
+
+
+def instrumented(method, label, of_model):
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler if of_model else self.model.profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            profiler.record(label, perf_counter() - start)
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+# Wrap the hot paths of the agents and the model. Done once, when the first model with a profiler is made,
+# so models without profiling pay nothing before that and a single attribute check after.
+def install():
+    global installed
+    if installed:
+        return
+    import importlib
+    for module, cls, method, label in INSTRUMENTED:
+        cls = getattr(importlib.import_module(module), cls)
+        setattr(cls, method, instrumented(cls.__dict__[method], label, cls.__name__ == "AntsWorld"))
+    installed = True
+
+
+# Calls and time spent in the instrumented methods of one model. Times of nested calls are included
+# in the time of the caller (e.g. "ant follow trail" is a part of "ant step").
+class Profiler:
+    def __init__(self, log_every=0):
+        self.log_every = log_every  # log the report every log_every-th step, never if 0
+        self.calls = {}
+        self.times = {}
+        install()
+
+    def record(self, label, elapsed):
+        self.calls[label] = self.calls.get(label, 0) + 1
+        self.times[label] = self.times.get(label, 0.0) + elapsed
+
+    def reset(self):
+        self.calls.clear()
+        self.times.clear()
+
+    def report(self):
+        return {label: {"calls": self.calls[label],
+                        "total_s": self.times[label],
+                        "mean_us": self.times[label] / self.calls[label] * 1e6}
+                for label in sorted(self.times, key=self.times.get, reverse=True)}
+
+    def format(self):
+        lines = ["{:<20} {:>10} {:>10} {:>10}".format("", "calls", "total s", "mean us")]
+        for label, row in self.report().items():
+            lines.append("{:<20} {calls:>10} {total_s:>10.3f} {mean_us:>10.1f}".format(label, **row))
+        return "\n".join(lines)
+
+    def on_step(self, model):
+        if self.log_every and model.schedule.steps % self.log_every == 0:
+            logger.info("step %d\n%s", model.schedule.steps, self.format())
@@ -0,0 +1,297 @@
+import json
+import mmap
+import os
+import tempfile
+import numpy as np
+
+DEFAULT_LAYERS = ("food trail", "food")
+PERSISTENT_LAYERS = ("food",)  # layers kept up to date by their owners, they don't evaporate
+TILE_CELLS = 1 << 16  # active cells evaporated at once by MappedPheromoneMap
+
+
+# values after `steps` turns of evaporation: minus one each turn while positive
+def decay(values, steps):
+    live = values > 0
+    if steps == 1:
+        values[live] -= 1
+    else:
+        values[live] -= np.minimum(np.ceil(values[live]), steps).astype(values.dtype)
+    return values
+
+
+# sets of flat cell ids per layer as arrays, which pickle much smaller, and back
+def cell_arrays(sets):
+    return {layer: np.fromiter(cells, np.intp, len(cells)) for layer, cells in sets.items()}
+
+
+def cell_sets(arrays):
+    return {layer: set(cells.tolist()) for layer, cells in arrays.items()}
+
+
+# All pheromone layers of the world stacked in one array of shape (n_layers, width, height).
+# Layers are keyed by name ("food trail", "food") or by the anthill owning the home trail.
+# Every cell with positive strength is kept in the active set of its layer (flat cell ids),
+# so evaporation only touches the cells of the trails instead of the whole map. Cells left below
+# zero (a trail evaporated past zero, a scent taken away) are kept in the residual set of the layer,
+# so every nonzero cell is in one of the two sets.
+class PheromoneMap:
+    def __init__(self, width, height, dtype=np.float32, capacity=4):
+        self.width = width
+        self.height = height
+        self.dtype = np.dtype(dtype)
+        self.layers = self.allocate(capacity)
+        self.index = {}
+        self.active = {}
+        self.residual = {}
+        self.free = list(reversed(range(capacity)))
+        self.persistent = set()
+        for key in DEFAULT_LAYERS:
+            self.add_layer(key, key in PERSISTENT_LAYERS)
+
+    # only the layers in use and the active cells as arrays go to snapshots
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        used = sorted(self.index.values())
+        state["layers"] = (len(self.layers), used, self.layers[used])
+        state["active"] = cell_arrays(self.active)
+        state["residual"] = cell_arrays(self.residual)
+        return state
+
+    def __setstate__(self, state):
+        capacity, used, layers = state.pop("layers")
+        self.__dict__.update(state)
+        self.layers = np.zeros((capacity, self.width, self.height), dtype=self.dtype)
+        self.layers[used] = layers
+        self.active = cell_sets(self.active)
+        self.residual = cell_sets(self.residual)
+
+    def __getitem__(self, key):
+        return self.layers[self.index[key]]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def cell_id(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def cell_pos(self, cell):
+        return divmod(cell, self.height)
+
+    @property
+    def nbytes(self):
+        return self.layers.nbytes
+
+    # double the number of slots; existing layers keep their indices
+    def grow(self):
+        capacity = len(self.layers)
+        self.resize(2 * capacity)
+        self.free = list(reversed(range(capacity, 2 * capacity))) + self.free
+
+    def allocate(self, capacity):
+        return np.zeros((capacity, self.width, self.height), dtype=self.dtype)
+
+    def resize(self, capacity):
+        layers = self.allocate(capacity)
+        layers[:len(self.layers)] = self.layers
+        self.layers = layers
+
+    def add_layer(self, key, persistent=False):
+        if key not in self.index:
+            if not self.free:
+                self.grow()
+            self.index[key] = self.free.pop()
+            self.active[self.index[key]] = set()
+            self.residual[self.index[key]] = set()
+            if persistent:
+                self.persistent.add(self.index[key])
+        return self[key]
+
+    # clear the layer and give its slot back for the next colony
+    def drop_layer(self, key):
+        layer = self.index.pop(key, None)
+        if layer is not None:
+            self.layers[layer] = 0
+            del self.active[layer]
+            del self.residual[layer]
+            self.persistent.discard(layer)
+            self.free.append(layer)
+
+    def deposit(self, key, pos, strength, max_strength):
+        layer = self[key]
+        x, y = pos
+        layer[x, y] = min(layer[x, y] + strength, max_strength)
+        if layer[x, y] > 0:
+            self.active[self.index[key]].add(x * self.height + y)
+            self.residual[self.index[key]].discard(x * self.height + y)
+
+    # raise the cell to at least the given strength
+    def mark(self, key, pos, strength):
+        layer = self[key]
+        x, y = pos
+        if layer[x, y] < strength:
+            layer[x, y] = strength
+            self.active[self.index[key]].add(x * self.height + y)
+            self.residual[self.index[key]].discard(x * self.height + y)
+
+    # add the amount (negative to take it away) to the cells
+    def add(self, key, cells, amount):
+        layer = self[key]
+        active = self.active[self.index[key]]
+        residual = self.residual[self.index[key]]
+        for x, y in cells:
+            layer[x, y] += amount
+            cell = x * self.height + y
+            if layer[x, y] > 0:
+                active.add(cell)
+                residual.discard(cell)
+            else:
+                active.discard(cell)
+                if layer[x, y] < 0:
+                    residual.add(cell)
+                else:
+                    residual.discard(cell)
+
+    # dictionary of cells with positive strength
+    def smell(self, key, cells):
+        layer = self[key]
+        smells = {}
+        for x, y in cells:
+            strength = float(layer[x, y])
+            if strength > 0:
+                smells[(x, y)] = strength
+        return smells
+
+    def n_active(self):
+        return sum(len(cells) for cells in self.active.values())
+
+    # nothing to release for layers in memory
+    def close(self):
+        pass
+
+    # same linear decay as `layers[layers > 0] -= 1` repeated `steps` times, restricted to the active cells
+    def evaporate(self, steps=1):
+        flat = self.layers.reshape(len(self.layers), -1)
+        for layer, active in self.active.items():
+            if not active or layer in self.persistent:
+                continue
+            cells = np.fromiter(active, np.intp, len(active))
+            values = decay(flat[layer, cells], steps)
+            flat[layer, cells] = values
+            active.difference_update(cells[values <= 0].tolist())
+            self.residual[layer].update(cells[values < 0].tolist())
+
+
+# name of a layer in the sidecar of MappedPheromoneMap
+def layer_name(key):
+    return key if isinstance(key, str) else "anthill {}".format(key.unique_id)
+
+
+# PheromoneMap whose layers live in a memory mapped file, for maps too big to keep all layers in memory.
+# Use it with a small dtype (float16 keeps whole strengths up to 100 exact). Next to the file a json
+# sidecar describes the layers, so offline tools can map them with open_layers without copying.
+# Evaporation goes through the active cells in the order of the file, a tile at a time, so only the pages
+# with trails are touched. A snapshot holds the values of the active and residual cells, the only ones which
+# are not zero, so it neither depends on the file nor reads all of it; a restored map writes them into a new
+# file of its own next to the original, which it deletes (with its sidecar) when it is closed.
+class MappedPheromoneMap(PheromoneMap):
+    def __init__(self, width, height, path, dtype=np.float16, capacity=4):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.owned = False  # the file is a temporary one made by __setstate__
+        super().__init__(width, height, dtype, capacity)
+
+    # layers of the given capacity over the file; the part of the file added reads as zeros
+    def allocate(self, capacity):
+        size = capacity * self.width * self.height * self.dtype.itemsize
+        self.file.truncate(size)
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+        return np.frombuffer(self.mmap, self.dtype).reshape(capacity, self.width, self.height)
+
+    # the file only grows, the layers already in it stay where they are
+    def resize(self, capacity):
+        self.layers = self.allocate(capacity)
+        self.write_sidecar()
+
+    def add_layer(self, key, persistent=False):
+        layer = super().add_layer(key, persistent)
+        self.write_sidecar()
+        return layer
+
+    def drop_layer(self, key):
+        super().drop_layer(key)
+        self.write_sidecar()
+
+    def write_sidecar(self, path=None):
+        path = path or self.path
+        with open(path + ".json", "w") as f:
+            json.dump({"width": self.width, "height": self.height, "dtype": self.dtype.str,
+                       "capacity": len(self.layers),
+                       "layers": {layer_name(key): layer for key, layer in self.index.items()}}, f, indent=2)
+
+    def flush(self):
+        self.mmap.flush()
+
+    def close(self):
+        self.flush()
+        self.layers = None
+        self.mmap.close()
+        self.file.close()
+        if self.owned:
+            os.remove(self.path)
+            os.remove(self.path + ".json")
+
+    def __getstate__(self):
+        state = {key: value for key, value in self.__dict__.items() if key not in ("layers", "mmap", "file")}
+        flat = self.layers.reshape(len(self.layers), -1)
+        layers = {}
+        for layer in self.index.values():
+            cells = np.sort(np.fromiter(self.active[layer] | self.residual[layer], np.intp))
+            layers[layer] = cells, flat[layer, cells]
+        state["layers"] = (len(self.layers), layers)
+        state["active"] = cell_arrays(self.active)
+        state["residual"] = cell_arrays(self.residual)
+        return state
+
+    def __setstate__(self, state):
+        capacity, layers = state.pop("layers")
+        self.__dict__.update(state)
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, self.path = tempfile.mkstemp(prefix="{}-restored-".format(name), dir=directory)
+        os.close(fd)
+        self.file = open(self.path, "r+b")
+        self.owned = True
+        self.layers = self.allocate(capacity)
+        flat = self.layers.reshape(capacity, -1)
+        for layer, (cells, values) in layers.items():
+            flat[layer, cells] = values
+        self.active = cell_sets(self.active)
+        self.residual = cell_sets(self.residual)
+        self.write_sidecar()
+
+    def evaporate(self, steps=1):
+        flat = self.layers.reshape(len(self.layers), -1)
+        for layer, active in self.active.items():
+            if not active or layer in self.persistent:
+                continue
+            cells = np.sort(np.fromiter(active, np.intp, len(active)))
+            for start in range(0, len(cells), TILE_CELLS):
+                tile = cells[start:start + TILE_CELLS]
+                values = decay(flat[layer, tile], steps)
+                flat[layer, tile] = values
+                active.difference_update(tile[values <= 0].tolist())
+                self.residual[layer].update(tile[values < 0].tolist())
+
+
+# read only views of the layers of a MappedPheromoneMap file, by layer name
+def open_layers(path):
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    layers = np.memmap(path, dtype=np.dtype(meta["dtype"]), mode="r",
+                       shape=(meta["capacity"], meta["width"], meta["height"]))
+    return {name: layers[layer] for name, layer in meta["layers"].items()}
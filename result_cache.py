@@ -0,0 +1,92 @@
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+
+# modules whose source decides the results of a run; editing any of them invalidates the cache
+MODEL_MODULES = ("ants_model", "ant_agent", "ants_space", "pheromones")
+MAX_BYTES = 256 * 2 ** 20
+
+
+def source_fingerprint(modules=MODEL_MODULES):
+    digest = hashlib.sha256()
+    for name in modules:
+        with open(importlib.util.find_spec(name).origin, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# stable name of a reporter: module level function or a partial of one (e.g. partial(count_ants, species_id=0))
+def reporter_name(reporter):
+    func = getattr(reporter, "func", reporter)
+    name = "{}.{}".format(func.__module__, func.__qualname__)
+    if func is not reporter:
+        name += json.dumps([reporter.args, reporter.keywords], sort_keys=True, default=str)
+    return name
+
+
+# Reporter results of finished runs on disk, one file per run. A run is keyed by the model class,
+# its parameters, the seed, the number of steps, the reporters and the fingerprint of the model source.
+# The least recently used runs are removed when the files take more than max_bytes.
+class ResultCache:
+    def __init__(self, directory=".result_cache", max_bytes=MAX_BYTES, fingerprint=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint or source_fingerprint()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self.sizes = {entry.path: entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".pkl")}
+        self.n_bytes = sum(self.sizes.values())
+
+    def key(self, model_cls, params, seed, max_steps, model_reporters):
+        canonical = json.dumps({
+            "model": "{}.{}".format(model_cls.__module__, model_cls.__qualname__),
+            "params": params,
+            "seed": seed,
+            "max_steps": max_steps,
+            "reporters": {name: reporter_name(reporter) for name, reporter in model_reporters.items()},
+            "source": self.fingerprint,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.stats["misses"] += 1
+            return None
+        os.utime(path)  # the modification time orders the runs for eviction
+        self.stats["hits"] += 1
+        return result
+
+    def put(self, key, result):
+        path = self.path(key)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)  # readers never see a half written file
+        self.n_bytes += os.path.getsize(path) - self.sizes.get(path, 0)
+        self.sizes[path] = os.path.getsize(path)
+        if self.n_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        for path in sorted(self.sizes, key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0):
+            if self.n_bytes <= self.max_bytes:
+                break
+            if os.path.exists(path):
+                os.remove(path)
+                self.stats["evictions"] += 1
+            self.n_bytes -= self.sizes.pop(path)
+
+    def clear(self):
+        for path in list(self.sizes):
+            if os.path.exists(path):
+                os.remove(path)
+        self.sizes.clear()
+        self.n_bytes = 0
@@ -1,6 +1,6 @@
 from ants_model import *
 from ant_agent import *
-from mesa.visualization.modules import CanvasGrid
+from delta_canvas import DeltaCanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
 from mesa.visualization.modules import PieChartModule
 
@@ -74,7 +74,9 @@ for i in range(MAX_N_SPECIES):
     model_params.update({"ant_size_{}".format(i): UserSettableParameter(
         "slider", "Ant Size of the Species {}".format(i), value=3, min_value=1, max_value=5)})
 
-world = CanvasGrid(agent_portrayal, width, height, 600, 600)
+# obstacles are sent once, then only the changes; the food trail is shown as a heatmap every 5th step
+world = DeltaCanvasGrid(agent_portrayal, width, height, 600, 600, static_types=(Obstacle,),
+                        heatmap="food trail", heatmap_every=5)
 chart_ants = PieChartModule(
     [{"Label": label, "Color": colour} for label, colour in zip(labels, colours)],
     canvas_height=250,